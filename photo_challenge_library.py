@@ -6,13 +6,131 @@
 '''
 
 import pywikibot
+from pywikibot.data import api
 import re
 import datetime
+import calendar
 import numpy as np
 import pandas as pd
 import requests
 import math
 import os
+import shelve
+import functools
+import itertools
+import csv
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_DIR   = os.path.join(os.path.expanduser('~'), '.cache', 'photo_challenge')
+API_WORKERS = 4  # concurrent API requests; keep low to respect Wikimedia API rate limits
+_page_texts = {} # page texts already read by this process: title -> (revid, text)
+
+# regular expressions used repeatedly, compiled once
+_RE_CHALLENGE        = re.compile(r"\{\{Commons:Photo challenge/([^}]+)\}\}")
+_RE_THUMB            = re.compile(r'\|thumb', flags=re.IGNORECASE)
+_RE_FILE_PREFIX      = re.compile(r'^file:', flags=re.IGNORECASE)
+_RE_SECTION          = re.compile(r"^===\s+(.*?)\s+===")
+_RE_VOTING_CHALLENGE = re.compile(r"Commons:Photo challenge/([^/]+)/Voting")
+_RE_ANCHOR_NUM       = re.compile(r'<span[^>]*>(\d+)</span>')  #===<span class="anchor" id="2">2</span>
+_RE_SECTION_NUM      = re.compile(r"===+(\d*)\.")               #===2. 
+_RE_CREATOR          = re.compile(r"\[\[User:([^|]+)")
+_RE_VOTER_CONTRIB    = re.compile(r"\[\[Special:Contributions/([^|\]]+)")
+_RE_VOTER_USER       = re.compile(r"\[\[(?:[Uu]ser|[Bb]enutzer|[Uu]suario):([^|\]]+)")
+_RE_AWARD            = re.compile(r"\{\{(\d)/3\*\}\}")
+_RE_OWN_WORK         = re.compile(r"\{\{(?:own|sf|own photo|self-photographed)\}\}", flags=re.IGNORECASE)
+_IP_CHARS            = '0123456789.'  # anonymous (IPv4) voters
+_MONTHS              = {m: f"{i:02d}" for i, m in enumerate(calendar.month_name) if m} # "January" -> "01"
+
+# places in file description pages where add_assesment_to_files looks for the winner 
+# template or for its insertion point; group number is the order of precedence
+_RE_ASSESSMENT_MARKER = re.compile(r"(\{\{Photo challenge winner)"      # 1: file already tagged
+                                   r"|(==\{\{int:license-header\}\}==)" # 2: insert before license section
+                                   r"|(\|other versions=\n\}\}\n\n)"    # 3: insert after {{Information}}
+                                   r"|(\[\[Category:)")                 # 4: insert before categories
+
+# lines of the voting page which parse_voting_page cares about, in order of precedence
+_RE_VOTING_LINE = re.compile(r"""^[^\S\n]*(?:
+        (?P<section>===.*)                  # section header: ===<span class="anchor" id="2">2</span>. ...
+      | (?P<file>.*\[\[File:.*)             # image: [[File:...|none|thumb|240px|title [...]]]
+      | (?P<creator>(?:<!--\ )?'''C.*)      # creator: <!-- '''Creator:''' [[User:...]] -->
+      | (?P<vote>.*\*\}\}.*)                # vote: *{{3/3*}} [[User:...]]
+    )$""", flags=re.MULTILINE | re.VERBOSE)
+
+# parameters of a single winner in [[Template:Photo challenge winners table]]
+_WINNER_FIELDS = ("|image_{n}  = {file.file_name}\n"
+                  "|title_{n}  = {title}\n"
+                  "|author_{n} = {file.creator}\n"
+                  "|score_{n}  = {file.score}\n"
+                  "|rank_{n}   = {file.rank}\n"
+                  "|num_{n}    = {file.num}\n")
+
+#=====================================================================================
+# === Utilities
+#=====================================================================================
+
+@functools.cache
+def _commons_site():
+    ''' Wikimedia Commons site object, created once and shared by all the functions '''
+    return pywikibot.Site("commons", "commons")
+
+#=====================================================================================
+@functools.cache
+def split_challenge(challenge: str) -> tuple:
+    ''' Split challenge name like "2025 - January - Cats" into year, month name, theme and 
+        two-digit month number, e.g. ("2025", "January", "Cats", "01") '''
+    year, month, theme = challenge.split(" - ", 2)
+    month_num = _MONTHS[month]
+    return year, month, theme, month_num
+
+#=====================================================================================
+def cached_page_text(page) -> str:
+    ''' Drop-in replacement for page.get() which keeps downloaded wikitext on disk and 
+        downloads it again only if the page was edited since it was cached. Checking the 
+        latest revision ID is a cheap "prop=info" call, compared to fetching the text.
+    '''
+    title = page.title()
+    revid = page.latest_revision_id
+    if _page_texts.get(title, (None,))[0] == revid:
+        return _page_texts[title][1]  # already read by this process
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with shelve.open(os.path.join(CACHE_DIR, 'pages')) as cache:
+        if title in cache and cache[title][0] == revid:
+            text = cache[title][1]
+        else:
+            text = page.get()
+            cache[title] = (revid, text)
+    _page_texts[title] = (revid, text)
+    return text
+
+#=====================================================================================
+def write_text_file(file_name: str, text: str):
+    ''' Write text in a single call to a temporary file which then replaces file_name, so 
+        that an interrupted run never leaves a half-written page behind '''
+    tmp_name = file_name + '.tmp'
+    with open(tmp_name, "w", encoding="utf-8") as fp:
+        fp.write(text)
+    os.replace(tmp_name, file_name)
+
+#=====================================================================================
+def _strip_html_comments(text: str) -> str:
+    ''' Remove all "<!-- ... -->" comments from wikitext. Same as 
+        re.sub(r'<!--.*?-->', '', text, flags=re.DOTALL), but scanning with str.find is 
+        much faster on large pages. Unterminated comment runs to the end of the page, 
+        the way MediaWiki treats it.
+    '''
+    out = []
+    pos = 0
+    while True:
+        start = text.find('<!--', pos)
+        if start < 0:
+            out.append(text[pos:])
+            break
+        out.append(text[pos:start])
+        end = text.find('-->', start+4)
+        if end < 0:
+            break
+        pos = end+3
+    return ''.join(out)
 
 #=====================================================================================
 # === Create voting pages
@@ -23,7 +141,7 @@ def copy_commons_page(source_title = 'Commons:Photo challenge/Submitting' ,
     '''copy content of Wikimedia Commons "Commons:Photo challenge/Submitting" page to 
        "Commons:Photo challenge/Submitting_old" '''
     # Connect to Wikimedia Commons
-    site = pywikibot.Site('commons', 'commons')
+    site = _commons_site()
     
     # Get source page
     source_page = pywikibot.Page(site, source_title)
@@ -37,11 +155,11 @@ def copy_commons_page(source_title = 'Commons:Photo challenge/Submitting' ,
 def get_submitted_challenges(source_title = 'Commons:Photo challenge/Submitting') -> list:
     ''' Parse [[Commons:Photo challenge/Submitting]] to get names of photo challenges this month
     '''
-    site = pywikibot.Site("commons", "commons")  # Wikimedia Commons
+    site = _commons_site()  # Wikimedia Commons
     page = pywikibot.Page(site, source_title)
-    text = page.get()  # full wikitext
-    text = re.sub(r'<!--.*?-->', '', text, flags=re.DOTALL)
-    challenge_list = re.findall(r"\{\{Commons:Photo challenge/([^}]+)\}\}", text)
+    text = cached_page_text(page)  # full wikitext
+    text = _strip_html_comments(text)
+    challenge_list = _RE_CHALLENGE.findall(text)
     return challenge_list
 
 #=====================================================================================
@@ -52,18 +170,19 @@ def parse_submition_page(wiki_text: str):
     seeking_gallery = True
 
     for line in wiki_text.splitlines():
-        line = line.strip()
-        #print(line)
         if seeking_gallery:
-            if line.startswith("<gallery ") and "250px" in line:
+            # cheap substring test first, so lines before the gallery are not stripped
+            if "250px" in line and line.lstrip().startswith("<gallery "):
                 seeking_gallery = False
         else:
-            if line.startswith("<!--") or line.strip() == "":
+            line = line.strip()
+            #print(line)
+            if line.startswith("<!--") or line == "":
                 continue
             if line.startswith("</gallery>"):
                 break
 
-            line = re.sub(re.escape('|thumb'), "", line, flags=re.IGNORECASE)
+            line = _RE_THUMB.sub("", line)
             line = line.replace('[[','').replace(']]','')
 
             bar = line.find("|")
@@ -73,56 +192,62 @@ def parse_submition_page(wiki_text: str):
             else:
                 fname = line
                 title = "" 
-            fname = re.sub(r'^file:', '', fname, flags=re.IGNORECASE) # Removes "file:" from the beginning of a string
+            fname = _RE_FILE_PREFIX.sub('', fname) # Removes "file:" from the beginning of a string
             fname = fname.replace("_", " ")
 
-            if len(title)==0:
-                dot = fname.rfind(".")
-                title = fname if dot == -1 else fname[:dot]
-
             if fname == "CLICK HERE To submit your photos to the challenge.svg":
                 continue
             files.append([fname, title])
             
     file_df = pd.DataFrame(files, columns=['file_name', 'title'])
+    # images without caption are titled with their file name without extension
+    missing = file_df['title'].eq('')
+    file_df.loc[missing, 'title'] = file_df.loc[missing, 'file_name'].str.rsplit('.', n=1).str[0]
     return file_df
 
 #=====================================================================================
 def get_file_info(site, file_df):
-    ''' For each file look up basic info
+    ''' For each file look up basic info, using batched "prop=imageinfo|revisions" API 
+        queries with up to 50 files per request
     '''
-    for col in ['user', 'uploaded', 'width', 'height','comment']:
-        file_df[col] = None
-    for irow, row in file_df.iterrows():
-        file_name = row['file_name'].replace(" ", "_")
-        file_page = pywikibot.FilePage(site, file_name)
-        if not file_page.exists():
-            print(f'File "{file_name}" does not exist')
-            continue
-            
-        meta = file_page.oldest_file_info
-        text = file_page.get().lower()
-        own_work = ('own work' in meta['comment']) or ('{{own}}' in text)  or ('{{sf}}' in text)
-        own_work = own_work or ('{{own photo}}' in text)  or ('{{self-photographed}}' in text)
-        file_df.loc[irow, 'user']     = meta['user']
-        file_df.loc[irow, 'uploaded'] = meta['timestamp']
-        file_df.loc[irow, 'width']    = meta['width']
-        file_df.loc[irow, 'height']   = meta['height']
-        file_df.loc[irow, 'comment']  = meta['comment'] 
-        file_df.loc[irow, 'own_work'] = own_work 
-        if not own_work:
-            print(f'[[File:{file_name}]] might not be own work\n')
-        
-    return file_df
+    # pywikibot normalizes titles the way MediaWiki does, so they match titles returned by the API
+    titles  = [pywikibot.FilePage(site, file_name).title() for file_name in file_df['file_name']]
+    unique  = list(dict.fromkeys(titles)) # file submitted twice is looked up once
+    records = []
+    for i in range(0, len(unique), 50):
+        pages = api.PropertyGenerator('imageinfo|revisions', site=site, titles='|'.join(unique[i:i+50]),
+                                      iiprop='user|timestamp|size|comment', iilimit='max',
+                                      rvprop='content', rvslots='main')
+        for page in pages:
+            if 'imageinfo' not in page:
+                continue # file does not exist
+            meta = page['imageinfo'][-1]                  # oldest version of the file
+            slot = page['revisions'][0]['slots']['main']  # name of the text field depends on API formatversion
+            records.append([page['title'], meta.get('user'), meta['timestamp'],
+                            meta['width'], meta['height'], meta.get('comment', ''), slot.get('content', slot.get('*', ''))])
+
+    info_df = pd.DataFrame(records, columns=['page_title', 'user', 'uploaded', 'width', 'height', 'comment', 'text'])
+    info_df = info_df.astype({'width': 'Int64', 'height': 'Int64'})
+    # parse all the ISO 8601 upload times at once; kept as naive UTC like the challenge dates
+    info_df['uploaded'] = pd.to_datetime(info_df['uploaded'], utc=True).dt.tz_localize(None)
+    info_df['own_work'] = (info_df['comment'].str.contains('own work', regex=False) | 
+                           info_df['text'   ].str.contains(_RE_OWN_WORK))
+    file_df = file_df.assign(page_title=titles).merge(info_df.drop(columns='text'), on='page_title', 
+                                                      how='left', validate='many_to_one')
+
+    for file_name in file_df.loc[file_df['user'].isna(), 'file_name']:
+        print(f'File "{file_name.replace(" ", "_")}" does not exist')
+    for file_name in file_df.loc[file_df['own_work'].eq(False), 'file_name']:
+        print(f'[[File:{file_name.replace(" ", "_")}]] might not be own work\n')
+    return file_df.drop(columns='page_title')
 
 #=====================================================================================
 def create_voting_page(challenge: str, file_df):
     ''' Create text of the voting page
     '''
     # Parse challenge string for dates
-    parts    = challenge.split(" - ")
-    theme    = parts[2] 
-    min_upload_date = datetime.datetime.strptime("1 {} {}".format(parts[1], parts[0]), "%d %B %Y")
+    year, month, theme, month_num = split_challenge(challenge)
+    min_upload_date = datetime.datetime(int(year), int(month_num), 1)
     file_name = f"{challenge}_voting.txt"
 
     max_upload_date = (min_upload_date + datetime.timedelta(days=31, hours=12)).replace(day=1)
@@ -130,7 +255,6 @@ def create_voting_page(challenge: str, file_df):
     vote_close_time = (max_upload_date + datetime.timedelta(days=31)).replace(day=1)
     size_px = 240000
     collapse_text = '{{Collapse top|Current votes – please choose your own winners before looking}}\n'
-    errors = []
 
     print('min_upload_date', min_upload_date)
     print('max_upload_date', max_upload_date)
@@ -139,76 +263,77 @@ def create_voting_page(challenge: str, file_df):
 
     min_upload_str = min_upload_date.strftime("%Y-%m-%d %H:%M:%S")
     max_upload_str = max_upload_date.strftime("%Y-%m-%d %H:%M:%S")
-    with open(file_name, "w", encoding="utf-8") as fp:
-        fp.write("__NOTOC__\n")
-        fp.write("\n'''Voting will end at midnight UTC on {:%d %B %Y}'''. The theme was '''{}'''.\n\n".format(
-            vote_close_time, theme))
-        fp.write("{{Commons:Photo challenge/Voting header/{{SuperFallback|Commons:Photo challenge/Voting header}}}}\n")
-        fp.write("{{Commons:Photo challenge/Voting example}}\n\n")
-
-        ifile = 0
-        for _, file in file_df.iterrows():
-            user  = f'[[User:{file['user']}|{file['user']}]]'
-            date  = file['uploaded']
-            fname = file['file_name']
-            if (user is None) or (date is None) or (fname is None):
-                error = f"File [[:File:{fname}]] does not exist"
-                errors.append(error)
-                continue
-                
-            date_str = date.strftime("%Y-%m-%d %H:%M:%S")
-            error = ''
-            if date and date < min_upload_date:
-                error = f"REMOVED: [[:File:{fname}]] by {user} was uploaded {date_str} before the challenge opened {min_upload_str}."
-
-            if date and date >= max_upload_date:
-                error = f"REMOVED: [[:File:{fname}]] by {user} was uploaded {date_str} after the challenge closed {max_upload_str}."
-
-            if not file['active']:
-                error = f"REMOVED: [[:File:{fname}]] by {user}, since the user uploded more than allowed 4 entries."
-                
-            if len(error)>0:
-                errors.append(error)
-                continue
-                
-            w = file['width'] 
-            h = file['height']
-            ifile += 1
-            thumb_width = int(math.sqrt(size_px * w / h))
-            user_text = f"<!-- '''Creator:''' {user} --> "
-            date_text = f"'''Uploaded:''' {date_str} "
-            size_text = "'''Size''': {} × {} ({} MP) ".format(w, h, w*h/1e6)
-            file_link = f"[{{{{filepath:{fname}}}}}<br>''(Full size image)'']"
-            num = f'<span class="anchor" id="{ifile}">{ifile}</span>'
-            
-            fp.write("==={}. {}===\n".format(num, os.path.basename(fname)))
-            fp.write("[[File:{}|none|thumb|{}px|{} {}]]\n".format(fname, thumb_width, file['title'], file_link))
-            fp.write(user_text+date_text+size_text+collapse_text)
-            fp.write("<!-- Vote below this line -->\n")
-            fp.write("<!-- Vote above this line -->\n")
-            fp.write("{{Collapse bottom}}\n\n")
-
-        if len(errors)>0:
-            fp.write(('=== Issues corrected by the [[Commons:Photo challenge/code/create voting.py|software]] ===\n'))
-            print("Issues:")
-            
-        for error in errors:
-            fp.write("* " + error + "\n")
-            print("* " + error + "\n")     
+    parts = []
+    parts.append("__NOTOC__\n")
+    parts.append(f"\n'''Voting will end at midnight UTC on {vote_close_time:%d %B %Y}'''. The theme was '''{theme}'''.\n\n")
+    parts.append("{{Commons:Photo challenge/Voting header/{{SuperFallback|Commons:Photo challenge/Voting header}}}}\n")
+    parts.append("{{Commons:Photo challenge/Voting example}}\n\n")
+
+    # classify all the files at once, the first matching rule decides the reason of removal
+    uploaded = pd.to_datetime(file_df['uploaded'])
+    date_str = uploaded.dt.strftime("%Y-%m-%d %H:%M:%S")
+    user     = '[[User:' + file_df['user'] + '|' + file_df['user'] + ']]'
+    removed  = 'REMOVED: [[:File:' + file_df['file_name'] + ']] by ' + user
+    rules    = {
+        'missing' : (file_df['user'].isna() | uploaded.isna(), 
+                     'File [[:File:' + file_df['file_name'] + ']] does not exist'),
+        'inactive': (~file_df['active'], 
+                     removed + ', since the user uploded more than allowed 4 entries.'),
+        'late'    : (uploaded >= max_upload_date, 
+                     removed + ' was uploaded ' + date_str + ' after the challenge closed ' + max_upload_str + '.'),
+        'early'   : (uploaded < min_upload_date, 
+                     removed + ' was uploaded ' + date_str + ' before the challenge opened ' + min_upload_str + '.'),
+    }
+    error = np.select([mask.to_numpy() for mask, _ in rules.values()], 
+                      [msg.to_numpy(dtype=object) for _, msg in rules.values()], default='')
+    errors  = [e for e in error if e]
+    file_df = file_df.assign(user_link=user, date_str=date_str)[error == '']
+
+    # thumbnail size of all images, so that each has the same area of size_px pixels
+    width   = file_df['width' ].to_numpy(dtype=np.float64)
+    height  = file_df['height'].to_numpy(dtype=np.float64)
+    file_df = file_df.assign(thumb_width = np.sqrt(size_px * width / height).astype(np.int64),
+                             megapixels  = file_df['width'].astype(np.int64) * file_df['height'].astype(np.int64) / 1e6,
+                             basename    = file_df['file_name'].str.rsplit('/', n=1).str[-1])
+
+    for ifile, file in enumerate(file_df.itertuples(index=False), start=1):
+        fname     = file.file_name
+        user_text = f"<!-- '''Creator:''' {file.user_link} --> "
+        date_text = f"'''Uploaded:''' {file.date_str} "
+        size_text = f"'''Size''': {file.width} × {file.height} ({file.megapixels} MP) "
+        file_link = f"[{{{{filepath:{fname}}}}}<br>''(Full size image)'']"
+        num = f'<span class="anchor" id="{ifile}">{ifile}</span>'
+
+        parts.append(f"==={num}. {file.basename}===\n")
+        parts.append(f"[[File:{fname}|none|thumb|{file.thumb_width}px|{file.title} {file_link}]]\n")
+        parts.append(user_text+date_text+size_text+collapse_text)
+        parts.append("<!-- Vote below this line -->\n")
+        parts.append("<!-- Vote above this line -->\n")
+        parts.append("{{Collapse bottom}}\n\n")
+
+    if len(errors)>0:
+        parts.append(('=== Issues corrected by the [[Commons:Photo challenge/code/create voting.py|software]] ===\n'))
+        print("Issues:")
+        
+    for error in errors:
+        parts.append("* " + error + "\n")
+        print("* " + error + "\n")     
+
+    write_text_file(file_name, ''.join(parts))
 
 #=====================================================================================
 def create_voting_page_from_submission_page(challenge: str):
     ''' Process a single challenge: parse submision page and create voting page
     '''
     files_file = f"{challenge}_submission_files.csv"
-    site = pywikibot.Site("commons", "commons")  # Wikimedia Commons
+    site = _commons_site()  # Wikimedia Commons
     # Parse Commons:Photo_challenge submission page
     page = pywikibot.Page(site, 'Commons:Photo challenge/' + challenge)
     if not page:
         print(f"Error: Can't open [[Commons:Photo challenge/{challenge}]]\n")
         return
 
-    file_df = parse_submition_page(page.get())
+    file_df = parse_submition_page(cached_page_text(page))
 
     # get info for all the files
     file_df = get_file_info(site, file_df)
@@ -230,18 +355,21 @@ def create_voting_page_from_submission_page(challenge: str):
 #=====================================================================================
 def get_new_text_of_voting_index(challenge_list: list):
     # Create new text for [[Commons:Photo challenge/Voting]]
-    site  = pywikibot.Site("commons", "commons")  # Wikimedia Commons
-    year, month, theme = challenge_list[0].split(" - ")
-    month  = datetime.datetime.strptime(month, "%B").strftime("%m")
+    site  = _commons_site()  # Wikimedia Commons
+    year, _, _, month = split_challenge(challenge_list[0])
     header = f'=== {{{{ucfirst:{{{{ISOdate|{year}-{month}|{{{{PAGELANGUAGE}}}}}}}}}}}} ==='
     print(header)
-    for challenge in challenge_list:
-        page = pywikibot.Page(site, 'Commons:Photo challenge/' + challenge)
-        if page:     
-            wiki_text = page.get()
+    # load text of all the challenge pages with a single "prop=revisions" query
+    pages = [pywikibot.Page(site, 'Commons:Photo challenge/' + challenge) for challenge in challenge_list]
+    for _ in site.preloadpages(pages, groupsize=50):
+        pass
+    for challenge, page in zip(challenge_list, pages):
+        if page.exists():
+            wiki_text = cached_page_text(page)
             for line in wiki_text.splitlines():
-                line = line.strip()
-                match = re.search(r"^===\s+(.*?)\s+===", line)
+                if '===' not in line:
+                    continue # only section headers are of interest
+                match = _RE_SECTION.search(line.strip())
                 if match:
                     challenge_code = match.group(1)
                     challenge_code = challenge_code.replace('|capitalization=ucfirst}}', '|capitalization=ucfirst|link=-}}')
@@ -251,138 +379,145 @@ def get_new_text_of_voting_index(challenge_list: list):
 # === Count voting pages
 #=====================================================================================
 
-def substr(pattern, text):
-    ''' Extract a single substring using regex command '''
+def substr(pattern: re.Pattern, text: str) -> str:
+    ''' Extract a single substring using compiled regex pattern '''
     res = ''
-    match = re.search(pattern, text)
+    match = pattern.search(text)
     if match:
         res = match.group(1).strip()
     return res
     
+#=====================================================================================
+def parse_award(line: str) -> str:
+    ''' Extract award from "{{3/3*}}" vote template. Same as substr(_RE_AWARD, line), but 
+        checks the very regular template with str.find first '''
+    i = line.find('/3*}}')
+    if i >= 3 and line[i-3:i-1] == '{{' and line[i-1].isdecimal():
+        return line[i-1]
+    return substr(_RE_AWARD, line)
+
 #=====================================================================================
 def get_voting_challenges(page_name = "Commons:Photo challenge/Voting"):
     ''' Inspect "Commons:Photo challenge/Voting" to get names of last month challenges '''
-    site = pywikibot.Site("commons", "commons")  # Wikimedia Commons
+    site = _commons_site()  # Wikimedia Commons
     page = pywikibot.Page(site, page_name)
-    text = page.get()  # full wikitext
-    text = re.sub(r'<!--.*?-->', '', text, flags=re.DOTALL)
-    header = substr(r"(===\s+.+\s+===)", text)
-    challenge_list = re.findall(r"Commons:Photo challenge/([^/]+)/Voting", text)
+    text = cached_page_text(page)  # full wikitext
+    text = _strip_html_comments(text)
+    challenge_list = _RE_VOTING_CHALLENGE.findall(text)
     return challenge_list
 
 #=====================================================================================
-def parse_voting_page(wiki_text: str):
-    ''' Load voting page and extract information about all the files and all the votes'''
+def parse_voting_page(wiki_text: str, num_pattern: re.Pattern = _RE_ANCHOR_NUM):
+    ''' Load voting page and extract information about all the files and all the votes. 
+        Image numbers are extracted from section headers with num_pattern: _RE_ANCHOR_NUM 
+        for "===<span class="anchor" id="2">2</span>. ..." headers, or _RE_SECTION_NUM for 
+        older "===2. ..." headers.
+    '''
     files = []
-    votes = []
-    points = [0,3,2,1]
+    votes = {'num': [], 'award': [], 'voter': [], 'creator': [], 'line': []} # vote_df columns
+    num = fname = title = creator = ''
 
-    for line in wiki_text.splitlines():
-        line = line.strip()
+    # single scan of the whole page, each match is one line of interest
+    for match in _RE_VOTING_LINE.finditer(wiki_text):
+        kind = match.lastgroup
+        line = match.group(kind).strip()
 
         # Section marker === ... ===
-        if line.startswith("==="):
-            #num   = substr(r"===(\d*)\.", line)  #===<span class="anchor" id="2">2</span>
-            num   = substr(r'<span[^>]*>(\d+)</span>', line)  #===<span class="anchor" id="2">2</span>
+        if kind == 'section':
+            num   = substr(num_pattern, line)
             fname = ''
             title = ''
             creator = ''
-            voter = ''
 
         # File lines
-        if "[[File:" in line:
+        elif kind == 'file':
             part  = line.replace("[[File:", "").replace("[", "|").split("|")
             fname = part[0].strip()
             if len(part) >= 5:
                 title = part[4].strip()
-            continue
 
         # Creator
-        if line.startswith("<!-- '''C") or line.startswith("'''C"):
-            creator = substr(r"\[\[User:([^|]+)", line)
+        elif kind == 'creator':
+            creator = substr(_RE_CREATOR, line)
             files.append([num, fname, title, creator])
-            continue
 
         # Votes
-        if "*}}" in line and fname != 'Sample-image.svg':
-            #voter = substr(r"\[\[(?::?\w:)?(?:\w{2}:)(?:[Uu]ser|[Bb]enutzer|[Uu]suario):([^|\]]+)", line)
+        elif fname != 'Sample-image.svg':
             if '[[Special:Contributions/' in line:
-                voter = substr(r"\[\[Special:Contributions/([^|\]]+)", line)
+                voter = substr(_RE_VOTER_CONTRIB, line)
             else:
-                voter = substr(r"\[\[(?:[Uu]ser|[Bb]enutzer|[Uu]suario):([^|\]]+)", line)
-            award = substr(r"{{(\d)/3\*}}", line)
+                voter = substr(_RE_VOTER_USER, line)
+            award = parse_award(line)
             line  = line.replace('<span class="signature-talk">{{int:Talkpagelinktext}}</span>','')
             if len(award)>0:
-                votes.append([num, int(award), voter, creator, line])
-                
+                for column, value in zip(votes.values(), (num, award, voter, creator, line)):
+                    column.append(value)
+
     file_df = pd.DataFrame(files, columns=['num', 'file_name', 'title', 'creator'])
-    vote_df = pd.DataFrame(votes, columns=['num', 'award', 'voter', 'creator', 'line'])
+    votes['award'] = np.array(votes['award'], dtype=np.int8) # awards are single digits
+    vote_df = pd.DataFrame(votes)
     return file_df, vote_df
 
 #=====================================================================================
-def parse_voting_page1(wiki_text: str):
-    ''' Load voting page and extract information about all the files and all the votes'''
-    files = []
-    votes = []
-    points = [0,3,2,1]
-
+def revise_voting_page(wiki_text: str, file_name: str):
+    ''' Alter Voting page after voting ends '''
+    cstr = "{{Collapse top|Current votes – please choose your own winners before looking}}"
+    parts = ['{{Discussion top}}']
     for line in wiki_text.splitlines():
-        line = line.strip()
-
-        # Section marker === ... ===
-        if line.startswith("==="):
-            num   = substr(r"===+(\d*)\.", line)
-            fname = ''
-            title = ''
-            creator = ''
-            voter = ''
-
-        # File lines
-        if "[[File:" in line:
-            part  = line.replace("[[File:", "").replace("[", "|").split("|")
-            fname = part[0].strip()
-            if len(part) >= 5:
-                title = part[4].strip()
+        if line.startswith("<!-- '''Creator"):
+            line = line.replace("<!-- ", "").replace(" -->", "").replace(cstr, '')
+        elif line.startswith("{{Collapse bottom}}"):
             continue
+        elif line.startswith("'''Voting will end"):
+            line = line.replace("Voting will end", "Voting ended")
+        parts.append(line+'\n')
+    parts.append('{{Discussion bottom}}')
 
-        # Creator
-        if line.startswith("<!-- '''C") or line.startswith("'''C"):
-            creator = substr(r"\[\[User:([^|]+)", line)
-            files.append([num, fname, title, creator])
-            continue
+    write_text_file(file_name, ''.join(parts))
 
-        # Votes
-        if "*}}" in line and fname != 'Sample-image.svg':
-            #voter = substr(r"\[\[(?::?\w:)?(?:\w{2}:)(?:[Uu]ser|[Bb]enutzer|[Uu]suario):([^|\]]+)", line)
-            if '[[Special:Contributions/' in line:
-                voter = substr(r"\[\[Special:Contributions/([^|\]]+)", line)
-            else:
-                voter = substr(r"\[\[(?:[Uu]ser|[Bb]enutzer|[Uu]suario):([^|\]]+)", line)
-            award = substr(r"{{(\d)/3\*}}", line)
-            line  = line.replace('<span class="signature-talk">{{int:Talkpagelinktext}}</span>','')
-            if len(award)>0:
-                votes.append([num, int(award), voter, creator, line])
-                
-    file_df = pd.DataFrame(files, columns=['num', 'file_name', 'title', 'creator'])
-    vote_df = pd.DataFrame(votes, columns=['num', 'award', 'voter', 'creator', 'line'])
-    return file_df, vote_df
+#=====================================================================================
+def get_users_info(site, user_names: list) -> dict:
+    ''' Look up edit count, registration date and block status of many users using 
+        "list=users" API queries with up to 50 users per request. Returns dictionary 
+        of API responses keyed by normalized user name.
+    '''
+    def query(chunk):
+        request = site.simple_request(action='query', list='users', 
+                                      usprop='editcount|registration|blockinfo', 
+                                      ususers='|'.join(chunk))
+        return request.submit()['query']['users']
+
+    # batches are independent, so run them concurrently
+    chunks = [user_names[i:i+50] for i in range(0, len(user_names), 50)]
+    with ThreadPoolExecutor(max_workers=API_WORKERS) as executor:
+        info = {user['name']: user for users in executor.map(query, chunks) for user in users}
+    return info
 
 #=====================================================================================
-def revise_voting_page(wiki_text: str, file_name: str):
-    ''' Alter Voting page after voting ends '''
-    cstr = "{{Collapse top|Current votes – please choose your own winners before looking}}"
-    with open(file_name, "w", encoding="utf-8") as fp:
-        fp.write('{{Discussion top}}')
-        for line in wiki_text.splitlines():
-            if line.startswith("<!-- '''Creator"):
-                line = line.replace("<!-- ", "").replace(" -->", "").replace(cstr, '')
-            elif line.startswith("{{Collapse bottom}}"):
-                continue
-            elif line.startswith("'''Voting will end"):
-                line = line.replace("Voting will end", "Voting ended")
-            fp.write(line+'\n')
-            
-        fp.write('{{Discussion bottom}}')
+def get_challenge_entrants(site, user_names: list) -> set:
+    ''' Find users who edited any of the "Commons:Photo challenge/<challenge>" submission 
+        pages, using "list=usercontribs" API queries limited to the Commons namespace 
+        with up to 50 users per request.
+    '''
+    def query(chunk):
+        contribs = api.ListGenerator('usercontribs', site=site, ucprop='title', ucnamespace=4,
+                                     ucuser='|'.join(chunk))
+        contribs.set_maximum_items(50 * len(chunk)) # entrants will have it among their latest edits
+        found = set()
+        for contrib in contribs:
+            page_name = contrib['title']
+            if page_name.startswith('Commons:Photo challenge/') and page_name.count('/')==1:
+                found.add(contrib['user'])
+                if len(found) == len(chunk):
+                    break # all users in this batch are entrants
+        return found
+
+    entrants = set()
+    chunks   = [user_names[i:i+50] for i in range(0, len(user_names), 50)]
+    with ThreadPoolExecutor(max_workers=API_WORKERS) as executor:
+        for found in executor.map(query, chunks):
+            entrants |= found
+    return entrants
 
 #=====================================================================================
 def validate_voters(site, vote_df, challenge):
@@ -391,43 +526,53 @@ def validate_voters(site, vote_df, challenge):
         accounts for at least 10 days and made 50 edits, and also to new Commons contributors 
         who have entered the challenge with a picture."
     '''
-    parts      = challenge.split(" - ")
-    start_date = datetime.datetime.strptime("30 {} {}".format(parts[1], parts[0]), "%d %B %Y")
+    year, _, _, month_num = split_challenge(challenge)
+    start_date = datetime.datetime(int(year), int(month_num), 30)
     voter_list = vote_df['voter'].unique()     # get unique voters names
     voter_list = voter_list[voter_list != '']  # remove empty strings
     voter_df   = pd.DataFrame(voter_list, columns = ['voter'])
-    voter_df['error'] = 0
-    voter_df['note']  = 0
-    for irow, row in voter_df.iterrows():
-        if re.fullmatch(r"[0-9.]+", row['voter']):
-            voter_df.loc[irow, 'error'] = 1 # mark IP adress
-            continue
-            
-        user = pywikibot.User(site, row['voter'])
-        edit_count = user.editCount()
-        reg_date   = user.registration()
-        voter_df.loc[irow, 'edit_count' ] = int(edit_count)
-        if user.isRegistered():
-            days_active = int((start_date - reg_date).days)
-            voter_df.loc[irow, 'reg_date'] = reg_date
-            voter_df.loc[irow, 'note']  = 1 if user.is_blocked() else 0
-        else:
-            voter_df.loc[irow, 'error'] = 2 # mark not registered users
+    n_voter     = len(voter_df)
+    names       = voter_df['voter'].map(lambda voter: pywikibot.User(site, voter).username) # as returned by the API
+    is_ip       = (names.str.strip(_IP_CHARS).eq('') & names.ne('')).to_numpy() # anonymous voters
+    edit_counts = [-1]   * n_voter
+    reg_dates   = [None] * n_voter
+    errors      = list(np.where(is_ip, 1, 0)) # mark IP adresses
+    notes       = [0]    * n_voter
+    flags       = {'error': errors, 'note': notes}
+
+    # look up all registered users with as few API calls as possible
+    names = names.tolist()
+    users = get_users_info(site, [name for name, ip in zip(names, is_ip) if not ip])
+    suspects = [] # users with too few edits or too new accounts
+    for irow in np.flatnonzero(~is_ip):
+        name = names[irow]
+        user = users.get(name, {'missing': ''})
+        edit_count = int(user.get('editcount', 0))
+        edit_counts[irow] = edit_count
+        if 'missing' in user or 'invalid' in user:
+            errors[irow] = 2 # mark not registered users
             continue
 
-        error = 'error'
+        # very old accounts have no registration date
+        reg_date = pywikibot.Timestamp.fromISOformat(user['registration']) if user.get('registration') else None
+        days_active = int((start_date - reg_date).days) if reg_date else math.inf
+        reg_dates[irow] = reg_date
+        notes[irow]     = 1 if 'blockid' in user else 0
         if days_active<10 or edit_count<50:  
-            # "New Commons contributors who have entered the challenge with a picture" are allowed to vote
-            for contrib in user.contributions():
-                page_name = contrib[0].title()
-                if page_name.startswith('Commons:Photo challenge/') and page_name.count('/')==1:
-                    error = 'note' # no error
-                    
-        if days_active<10: voter_df.loc[irow, error] = 3 # mark users registered less than 10 days before begining of voting
-        if edit_count<50:  voter_df.loc[irow, error] = 4 # mark users with less than 50 edits
-
-    voter_df['edit_count'] = voter_df['edit_count'].fillna(-1).astype(int)
-    voter_df['error']      = voter_df['error'     ].fillna( 0).astype(int) 
+            suspects.append((irow, days_active, edit_count))
+
+    # "New Commons contributors who have entered the challenge with a picture" are allowed to vote
+    entrants = get_challenge_entrants(site, [names[irow] for irow, _, _ in suspects])
+    for irow, days_active, edit_count in suspects:
+        error = 'note' if names[irow] in entrants else 'error'
+        if days_active<10: flags[error][irow] = 3 # mark users registered less than 10 days before begining of voting
+        if edit_count<50:  flags[error][irow] = 4 # mark users with less than 50 edits
+
+    # assign all the columns at once, instead of cell by cell
+    voter_df = voter_df.assign(edit_count = np.asarray(edit_counts, dtype=np.int64),
+                               reg_date   = reg_dates,
+                               error      = np.asarray(errors, dtype=np.int64),
+                               note       = np.asarray(notes,  dtype=np.int64))
     #voter_df.to_csv("voters.csv", index=False)
     return voter_df
 
@@ -440,104 +585,102 @@ def validate_votes(vote_df, voter_df):
         their own picture."
     '''
     # copy disqualifying issues from voter dataframe voter_df to vote_df
-    vote_df = vote_df.merge(voter_df[["voter", "error"]], on="voter", how="left")
+    vote_df = vote_df.merge(voter_df[["voter", "error"]], on="voter", how="left", validate="many_to_one")
     # allow disqualified voters to award High Commendations
     vote_df.loc[ (vote_df["award"] == 0) & (vote_df["error"] > 0), 'error'] = 0 
     #vote_df['error'] = vote_df['error'].fillna(-9).astype(int) # make column an integer column
 
-    # mark duplicate votes or a user voting for the same image twice. The second vote will be nullified
-    vote_df.loc[vote_df.duplicated(subset=["num", "voter"]), 'error'] = 5 
+    # integer codes of voters, images and awards computed once and reused by all the checks below
+    voter_codes = pd.factorize(vote_df['voter'])[0]
+    num_codes   = pd.factorize(vote_df['num'  ])[0]
+    awards      = vote_df['award'].to_numpy()
 
-    # mark unsigned votes
-    vote_df.loc[vote_df["voter"]=='', 'error'] = 6 
-
-    # mark instances where image creator voted for their own image
-    vote_df.loc[vote_df["voter"]==vote_df["creator"], 'error'] = 7 
+    # mark, in order of precedence: instances where image creator voted for their own image, 
+    # unsigned votes, and duplicate votes or a user voting for the same image twice (the 
+    # second vote will be nullified). One np.select pass; earlier conditions win
+    vote_key = voter_codes * (num_codes.max(initial=0) + 1) + num_codes
+    error = np.select([(vote_df["voter"]==vote_df["creator"]).to_numpy(), 
+                       (vote_df["voter"]=='').to_numpy(), 
+                       pd.Series(vote_key).duplicated().to_numpy()], 
+                      [7, 6, 5], default=vote_df['error'].to_numpy())
 
     # mark votes by voters who voted for more than one 1st, 2nd or 3rd place. 
-    mask1 = (vote_df["award"] > 0) & (vote_df["error"] == 0)
-    mask2 = vote_df[mask1].duplicated(subset=["award", "voter"], keep=False)
-    #for award in range(1,4):
-    #    df = vote_df[(vote_df["award"] == award) & (vote_df["error"] == 0)]
-    print('validate_votes 1', mask1.count(), mask1.sum()  ) 
-    print('validate_votes 2', mask2.count(), mask2.sum()  ) 
-
-    vote_df.loc[mask1 & mask2, 'error'] = 8 # mark multiple same award by a single user
+    mask1 = (awards > 0) & (error == 0)
+    award_key = voter_codes * (awards.max(initial=0) + 1) + awards
+    award_count = np.bincount(award_key[mask1], minlength=award_key.max(initial=0) + 1)
+    mask2 = award_count[award_key] > 1
+    vote_df['error'] = np.where(mask1 & mask2, 8, error) # mark multiple same award by a single user
     return vote_df 
 
 #=====================================================================================
 def list_errors(vote_df, voter_df, challenge):
     errors = ['=== Issues corrected by the [[Commons:Photo challenge/code/Photo challenge library.py|software]] ===']
     
-    # Report user based issues
-    df = voter_df.sort_values(by="error", ascending=True)
-    df = df[df['error']>0]
-    for _, row in df.iterrows():
-        user = f'* [[User:{row['voter']}]] '
-        match row['error']:
-            case 1: # Report IP adresses
-                user  = f'* ({row['error']}) [[Special:Contributions/{row['voter']}|{row['voter']}]] '
-                error = f'is an anonymous IP adress'
-            case 2: # Report unregistered users
-                error = f' is not registered'
-            case 3:  # Report users with accounts less then 10 days old
-                registered = registration(row['voter'])
-                error = (f'*{registered} on {row['reg_date']} which is less then '
-                        'required 10 days before voting started')
-            case 4:  # Report users with less then required 50 edits
-                error = (f'made [[Special:Contributions/{row['voter']}|{row['edit_count']} edits on Commons]], '
-                         'which is less then required 50')
-        errors.append(user + error +  ' 🡆 their votes were not counted')
+    # Report user based issues. Messages are built column-wise and the matching one
+    # is picked per row by error code
+    df = voter_df[voter_df['error']>0].sort_values(by="error", ascending=True)
+    err      = df['error'].to_numpy()
+    voter    = df['voter']
+    user     = '* [[User:' + voter + ']] '
+    contribs = '[[Special:Contributions/' + voter + '|'
+    reg_date = df['reg_date'].astype(object).astype(str)
+    error    = np.select(
+        [err==1, err==2, err==3, err==4],
+        [('* (1) ' + contribs + voter + ']] is an anonymous IP adress').to_numpy(),         # IP adresses
+         (user + ' is not registered').to_numpy(),                                          # unregistered users
+         (user + '*' + voter.map(registration) + ' on ' + reg_date                          # accounts less then 10 days old
+              + ' which is less then required 10 days before voting started').to_numpy(), 
+         (user + 'made ' + contribs + df['edit_count'].map(str)                             # less then required 50 edits
+              + ' edits on Commons]], which is less then required 50').to_numpy()], 
+        default='')
+    errors.extend(e + ' 🡆 their votes were not counted' for e in error if e)
         
     # Report voting issues
-    df = vote_df.sort_values(by="error", ascending=True)
-    df = df[df['error']>0]
+    df = vote_df[vote_df['error']>0].sort_values(by="error", ascending=True)
     df.to_csv("vote_errors.csv", index=False)
 
-    for _, row in df.iterrows():
-        user  = f'[[User:{row['voter']}]]'
-        n     = int(row['num'])
-        image = f'[[Commons:Photo challenge/{challenge}/Voting#{n}|Image #{n}]]'
-        match row['error']:
-            case 5: # user voting for the same image twice
-                error = f'* [[User:{row['voter']}]] voted more than once for {image} 🡆 subsequent votes were not counted'
-            case 6:  # Report unsigned votes
-                error = f'* Unsigned vote for {image} was detected 🡆 it was not counted (line was: "{row['line']}")'
-            case 7: # Report self voting
-                error = f'* {user} voted for their own {image} 🡆 their vote was not counted'
-            case _:
-                continue
-        errors.append(error)        
+    err   = df['error'].to_numpy()
+    user  = '* [[User:' + df['voter'] + ']]'
+    n     = df['num'].astype(int).astype(str)
+    image = '[[Commons:Photo challenge/' + challenge + '/Voting#' + n + '|Image #' + n + ']]'
+    error = np.select(
+        [err==5, err==6, err==7],
+        [(user + ' voted more than once for ' + image + ' 🡆 subsequent votes were not counted').to_numpy(),
+         ('* Unsigned vote for ' + image + ' was detected 🡆 it was not counted (line was: "' 
+              + df['line'] + '")').to_numpy(), 
+         (user + ' voted for their own ' + image + ' 🡆 their vote was not counted').to_numpy()], 
+        default='')
+    errors.extend(e for e in error if e)
 
     # Report multi voting
     voters = vote_df[vote_df['error']==8]['voter'].unique()
     place = ['', '3rd', '2nd', '1st']
+    link_map = {n: f'[[Commons:Photo challenge/{challenge}/Voting#{n}|{n}]]' for n in vote_df['num'].unique()}
     ignore = ' 🡆 those votes were not counted'
     for voter in voters:
         df = vote_df[(vote_df['error']==8) & (vote_df['voter']==voter)]
         for award in range(1,4):
             images = df[df['award']==award]['num']
             if (len(images)==0): continue
-            img_str = format_array(images, challenge )
+            img_str = format_array(images, link_map)
             error = f'* [[User:{voter}]] awarded {place[award]} place to multiple images ({img_str}) {ignore}'  
             errors.append(error)
             
     if len(errors)==1:
         errors.append('* no issues found')
         
-    df = voter_df.sort_values(by="note", ascending=True)
-    df = df[df['note']>0]
+    df = voter_df[voter_df['note']>0].sort_values(by="note", ascending=True)
     if len(df)>0:
         errors.append('\n=== Other (potential) Issues ===')
-    for _, row in df.iterrows():
-        user = f'* [[User:{row['voter']}]] '
-        match row['note']:
+    for voter, note in df[['voter', 'note']].itertuples(index=False, name=None):
+        user = f'* [[User:{voter}]] '
+        match note:
             case 1:
                 error = f'is currently blocked'
             case 3:
                 error = f'registered less then 10 days before voting started; however, they have entered the challenge with a picture'
             case 4:
-                error = f'[[Special:Contributions/{row['voter']}|made less then required 50 edits]] on Commons; however, they have entered the challenge with a picture'
+                error = f'[[Special:Contributions/{voter}|made less then required 50 edits]] on Commons; however, they have entered the challenge with a picture'
             case _:
                 continue
         errors.append(user + error)
@@ -550,8 +693,9 @@ def registration(user):
    return f'<span class="plainlinks">{link}</span>'
 
 #=====================================================================================
-def format_array(vec, challenge ):
-    nums = [f'[[Commons:Photo challenge/{challenge}/Voting#{n}|{n}]]' for n in vec]
+def format_array(vec, link_map: dict):
+    ''' List image links from link_map in "1, 2 and 3" form '''
+    nums = [link_map[n] for n in vec]
         
     if len(nums) == 0:
         return ""
@@ -567,20 +711,19 @@ def count_votes(vote_df, file_df):
     # score the results. According to the documentation: "The Score is the sum of the 
     # 3*/2*/1* votes. The Support is the count of 3*/2*/1* votes and 0* likes. "
     votes = vote_df[vote_df["error"] >= 0]
-    df1 = votes.groupby("num", as_index=False)["award"].sum()
-    df2 = votes.groupby("num", as_index=False)["award"].count()
-    df1.rename(columns={"award": "score"  }, inplace=True)
-    df2.rename(columns={"award": "support"}, inplace=True)
-    file_df = file_df.merge(df1, on="num", how="left").merge(df2, on="num", how="left")
+    df = votes.groupby("num", as_index=False).agg(score=("award", "sum"), support=("award", "count"))
+    file_df = file_df.merge(df, on="num", how="left", validate="many_to_one")
 
     # determine rank which is based on the score, but in the event of a tie vote, the support decides the rank
-    max_support = file_df['support'].max() + 1
-    file_df['score2'] = file_df['score'] + file_df['support']/max_support
-    file_df = file_df.sort_values(by="score2"  , ascending=False)
-    file_df["rank"] = file_df['score2'].rank(method="min", ascending=False, numeric_only=True)
-    file_df["score"]   = file_df["score"  ].fillna(0).astype(int)
-    file_df["support"] = file_df["support"].fillna(0).astype(int)
-    file_df["rank"]    = file_df["rank"   ].fillna(0).astype(int)
+    # images with the same score and support share the rank of the first of them
+    file_df = file_df.sort_values(by=["score", "support"], ascending=False)
+    score   = file_df['score'  ].to_numpy()
+    support = file_df['support'].to_numpy()
+    is_new  = np.r_[True, (score[1:] != score[:-1]) | (support[1:] != support[:-1])]
+    ranks   = np.maximum.accumulate(np.where(is_new, np.arange(1, len(file_df)+1), 0))
+    ranks   = np.where(np.isnan(support), 0, ranks) # images without votes are sorted last and have no rank
+    file_df["rank"] = ranks
+    file_df[["score", "support"]] = file_df[["score", "support"]].fillna(0).astype(np.int64)
     return file_df
 
 #=====================================================================================
@@ -590,177 +733,240 @@ def create_result_page(file_df, n_voter: int, file_name: str, errors: list):
     n_creator = file_df['creator'].nunique()
     n_images  = file_df['num'].nunique()
     talk_str  = '<span class="signature-talk">{{int:Talkpagelinktext}}</span>'
-    with open(file_name, "w", encoding="utf-8") as fp:
-        fp.write(f"*Number of contributors: {n_creator}\n")
-        fp.write(f"*Number of voters:       {n_voter}\n")
-        fp.write(f"*Number of images:       {n_images}\n\n")   
-        fp.write("The Score is the sum of the 3*/2*/1* votes. ")   
-        fp.write("The Support is the count of 3*/2*/1* votes and 0* likes. I")   
-        fp.write("In the event of a tie vote, the support decides the rank.\n\n")   
-        fp.write('{| class="sortable wikitable"\n|-\n') 
-        fp.write('! class="unsortable"| Image\n') 
-        fp.write('! Author\n') 
-        fp.write('! data-sort-type="number" | Rank\n') 
-        fp.write('! data-sort-type="number" | Score\n') 
-        fp.write('! data-sort-type="number" | Support\n') 
-        for ifile, file in file_df.iterrows():
-            _, fname, _, user, score, support, _, rank = file.tolist()
-            if support==0:
-                break
-            user_str = f'[[User:{user}|{user}]] ([[User talk:{user}|{talk_str}]])'
-            fp.write(f'|-\n| [[File:{fname}|120px]] || {user_str} || {rank} || {score} || {support}\n')   
-            
-        fp.write('|}\n\n')   
+    parts = []
+    parts.append(f"*Number of contributors: {n_creator}\n")
+    parts.append(f"*Number of voters:       {n_voter}\n")
+    parts.append(f"*Number of images:       {n_images}\n\n")   
+    parts.append("The Score is the sum of the 3*/2*/1* votes. ")   
+    parts.append("The Support is the count of 3*/2*/1* votes and 0* likes. I")   
+    parts.append("In the event of a tie vote, the support decides the rank.\n\n")   
+    parts.append('{| class="sortable wikitable"\n|-\n') 
+    parts.append('! class="unsortable"| Image\n') 
+    parts.append('! Author\n') 
+    parts.append('! data-sort-type="number" | Rank\n') 
+    parts.append('! data-sort-type="number" | Score\n') 
+    parts.append('! data-sort-type="number" | Support\n') 
+    columns = ['file_name', 'creator', 'score', 'support', 'rank']
+    for fname, user, score, support, rank in file_df[columns].itertuples(index=False, name=None):
+        if support==0:
+            break
+        user_str = f'[[User:{user}|{user}]] ([[User talk:{user}|{talk_str}]])'
+        parts.append(f'|-\n| [[File:{fname}|120px]] || {user_str} || {rank} || {score} || {support}\n')   
+        
+    parts.append('|}\n\n')   
+
+    for error in errors:
+        parts.append(error + "\n")     
 
-        for error in errors:
-            fp.write(error + "\n")     
+    write_text_file(file_name, ''.join(parts))
 
 #=====================================================================================
 def create_winners_page(file_df, file_name: str, challenge: str):
     ''' Create text of the "Winners" page with [[Template:Photo challenge winners table]]
         listing winners of the photo challenge
     '''
-    year, month, theme = challenge.split(" - ")
-    with open(file_name, "w", encoding="utf-8") as fp:
-        fp.write("{{Photo challenge winners table\n");
-        fp.write(f"|page     = Photo challenge/{challenge}\n")
-        fp.write(f"|theme    = {theme}\n")
-        fp.write( "|height   = {{{height|240}}}\n");
-        for i in range(3):
-            title = add_line_breaks(file_df.iloc[i]["title"], 40)
-            fp.write("|image_{}  = {}\n".format(i+1, file_df.iloc[i]["file_name"]))
-            fp.write("|title_{}  = {}\n".format(i+1, title))
-            fp.write("|author_{} = {}\n".format(i+1, file_df.iloc[i]["creator"]))
-            fp.write("|score_{}  = {}\n".format(i+1, file_df.iloc[i]["score"]))
-            fp.write("|rank_{}   = {}\n".format(i+1, file_df.iloc[i]["rank"]))
-            fp.write("|num_{}    = {}\n".format(i+1, file_df.iloc[i]["num"]))
-
-        fp.write("}}\n\n")
-
-#=====================================================================================
-def talk_to_winners(challenge: str):
-    files_file = f"{challenge}_files.csv"
-    file_df    = pd.read_csv(files_file)
-    site       = pywikibot.Site("commons", "commons")  # Wikimedia Commons
+    year, month, theme, _ = split_challenge(challenge)
+    parts = []
+    parts.append("{{Photo challenge winners table\n")
+    parts.append(f"|page     = Photo challenge/{challenge}\n")
+    parts.append(f"|theme    = {theme}\n")
+    parts.append( "|height   = {{{height|240}}}\n")
+    for n, file in enumerate(file_df.head(3).itertuples(index=False), start=1):
+        parts.append(_WINNER_FIELDS.format(n=n, file=file, title=add_line_breaks(file.title, 40)))
+    parts.append("}}\n\n")
+
+    write_text_file(file_name, ''.join(parts))
+
+#=====================================================================================
+def _load_top_files(challenge: str, n: int = 3, file_df=None) -> list:
+    ''' Read only the first n rows of "<challenge>_files.csv" written by process_challenge, 
+        which are the highest ranked images. Rows are returned as dictionaries of strings; 
+        a few cell reads do not need a DataFrame. If file_df returned by process_challenge 
+        is given, its rows are used instead of reading the file back.
+    '''
+    if file_df is not None:
+        return file_df.head(n).to_dict('records')
+    with open(f"{challenge}_files.csv", newline='', encoding="utf-8") as fp:
+        return list(itertools.islice(csv.DictReader(fp), n))
+
+#=====================================================================================
+def _preload_for_save(site, pages: list):
+    ''' Load text and templates of the pages with batched queries, 50 pages each. Page.save 
+        checks {{bots}}/{{nobots}} opt-outs on the page before every edit, and with the 
+        preloaded text and templates that check makes no further requests '''
+    for _ in site.preloadpages(pages, groupsize=50, content=True, templates=True):
+        pass
+
+#=====================================================================================
+def talk_to_winners(challenge: str, file_df=None):
+    rows = _load_top_files(challenge, 10, file_df)
+    site = _commons_site()  # Wikimedia Commons
 
     # text to be added to user's talk pages:
     color= ['', 'Gold', 'Silver', 'Bronze']
-    year, month, theme = challenge.split(" - ")
-    for i in range(10):
-        rank = int(file_df.iloc[i]["rank"])
-        if rank>3:
-            continue
-        fname   = file_df.iloc[i]["file_name"]
-        page_title = 'User:' + file_df.iloc[i]["creator"]
+    year, month, theme, _ = split_challenge(challenge)
+    winners = [row for row in rows if int(row["rank"]) <= 3]
+
+    # load all the talk pages with a single query; messages are appended by the server, 
+    # the text is only needed for the {{nobots}} opt-out check done by Page.save
+    talk_pages = {user: pywikibot.Page(site, 'User:' + user).toggleTalkPage() for user in {row["creator"] for row in winners}}
+    _preload_for_save(site, list(talk_pages.values()))
+    for row in winners:
+        rank   = int(row["rank"])
+        fname  = row["file_name"]
         header = f"[[Commons:Photo challenge/{challenge}/Winners]]"
-        text   = "{{{{Photo Challenge {}|File:{}|{}|{}|{}}}}}".format(
-                  color[rank], fname, theme, year, month)
+        text   = f"{{{{Photo Challenge {color[rank]}|File:{fname}|{theme}|{year}|{month}}}}}"
 
-        talk_page = pywikibot.Page(site, page_title).toggleTalkPage()
+        talk_page = talk_pages[row["creator"]]
         if not talk_page.exists():
             print('Talk page does not exist')
             return
 
-        talk_page.text += f"\n\n== {header} ==\n{text}--~~~~"
-        talk_page.save(summary="Announcing Photo Challenge winners")
+        talk_page.save(summary="Announcing Photo Challenge winners",
+                       appendtext=f"\n\n== {header} ==\n{text}--~~~~")
         
 #=====================================================================================
-def announce_challenge_winners(challenge_list: list):
+def _winners_announcement(challenge_list: list, file_dfs=None) -> dict:
+    ''' Edit of [[Commons talk:Photo challenge]] announcing winners of both challenges: new 
+        section appended on the server, so the edit does not depend on the current text '''
     challenge1, challenge2 = challenge_list
-    year, month, theme = challenge1.split(" - ")
+    year, month, theme, _ = split_challenge(challenge1)
     header = f"[[Commons:Photo challenge|Photo challenge]] {month} results"
     text1  = f"{{{{Commons:Photo challenge/{challenge1}/Winners|height=240}}}}" 
     text2  = f"{{{{Commons:Photo challenge/{challenge2}/Winners|height=240}}}}" 
 
-    file1_df = pd.read_csv(f"{challenge1}_files.csv")
-    file2_df = pd.read_csv(f"{challenge2}_files.csv")
-    users = [file1_df.iloc[0]["creator"], file1_df.iloc[1]["creator"], file1_df.iloc[2]["creator"],
-             file2_df.iloc[0]["creator"], file2_df.iloc[1]["creator"], file2_df.iloc[2]["creator"]]
+    file1_df, file2_df = file_dfs or (None, None)
+    rows  = _load_top_files(challenge1, file_df=file1_df) + _load_top_files(challenge2, file_df=file2_df)
+    users = [row["creator"] for row in rows]
     users = [f"[[User:{u}|]]" for u in users]
     text3 = "Congratulations to " + ", ".join(users[:-1]) + " and " + users[-1]
-    
-    site      = pywikibot.Site("commons", "commons")  # Wikimedia Commons
-    talk_page = pywikibot.Page(site, 'Commons:Photo challenge').toggleTalkPage()
-    if not talk_page.exists():
-        print('Talk page does not exist')
+    return dict(summary="Announcing Photo Challenge winners", 
+                appendtext=f"\n\n== {header} ==\n{text1}\n{text2}\n{text3}--~~~~")
+
+#=====================================================================================
+def _save_if_exists(page, missing_msg: str, make_edit, *args):
+    ''' Save edit returned by make_edit(*args) (like _winners_announcement or 
+        _previous_page_update) to the page, or print missing_msg if the page does not exist '''
+    if not page.exists():
+        print(missing_msg)
         return
+    page.save(**make_edit(*args))
 
-    talk_page.text += f"\n\n== {header} ==\n{text1}\n{text2}\n{text3}--~~~~"
-    talk_page.save(summary="Announcing Photo Challenge winners")
+#=====================================================================================
+def announce_challenge_winners(challenge_list: list, file_dfs=None):
+    site      = _commons_site()  # Wikimedia Commons
+    talk_page = pywikibot.Page(site, 'Commons:Photo challenge').toggleTalkPage()
+    _preload_for_save(site, [talk_page])
+    _save_if_exists(talk_page, 'Talk page does not exist', _winners_announcement, challenge_list, file_dfs)
+
+#=====================================================================================
+def _report_assesment_save(page, err):
+    ''' Callback of the asynchronous saves queued by add_assesment_to_files '''
+    if err is None:
+        print('Added assesment template to ' + page.title())
+    else:
+        print(f'Failed to add assesment template to {page.title()}: {err}')
 
 #=====================================================================================
-def add_assesment_to_files(challenge_list: list):
-    site = pywikibot.Site("commons", "commons")  # Wikimedia Commons
+def add_assesment_to_files(challenge_list: list, file_dfs=None):
+    site = _commons_site()  # Wikimedia Commons
     header = "=={{Assessment}}==\n"
-    marker1 = "=={{int:license-header}}=="
-    marker2 = "|other versions=\n}}\n\n"
-    marker3 = "[[Category:"
-    for idx, challenge in enumerate(challenge_list):
-        year, month, theme = challenge.split(" - ")
-        file_df = pd.read_csv(f"{challenge}_files.csv")
-        for ifile in range(3):
-            file = 'File:' + file_df.iloc[ifile]["file_name"]
-            template = f"{{{{Photo challenge winner|{ifile+1}|{theme}|{year}|{month}}}}}\n\n" 
-            page = pywikibot.Page(site, file)
-            if not page.exists():
-                continue
-            text = page.text
-            if '{{Photo challenge winner' in text:
-                continue
-            if (marker1 in text):
-                before, after = text.split(marker1, 1)
-                page.text = before + header + template + marker1 + after
-            elif (marker2 in text):
-                before, after = text.split(marker2, 1)
-                page.text = before + marker2 + header + template + after
-            else:
-                before, after = text.split(marker3, 1)
-                page.text = before + header + template + marker3 + after
-                
-            page.save(summary="Assessment added - congratulations")
-            print('Adding assesment template to ' + file)
+    # collect top 3 files of each challenge and the template to be added to each
+    pages, templates = [], []
+    for challenge, file_df in zip(challenge_list, file_dfs or [None]*len(challenge_list)):
+        year, month, theme, _ = split_challenge(challenge)
+        for ifile, row in enumerate(_load_top_files(challenge, file_df=file_df)):
+            pages.append(pywikibot.Page(site, 'File:' + row["file_name"]))
+            templates.append(f"{{{{Photo challenge winner|{ifile+1}|{theme}|{year}|{month}}}}}\n\n")
+
+    # load text of all the file pages with a single "prop=revisions" query
+    for _ in site.preloadpages(pages, groupsize=50):
+        pass
+    for page, template in zip(pages, templates):
+        if not page.exists():
+            continue
+        # single scan of the page for the first occurrence of each marker
+        text  = page.text
+        first = {}
+        for match in _RE_ASSESSMENT_MARKER.finditer(text):
+            first.setdefault(match.lastindex, match)
+            if match.lastindex == 1:
+                break
+        if 1 in first:
+            continue
+        if 2 in first:
+            pos = first[2].start()
+        elif 3 in first:
+            pos = first[3].end()
+        else:
+            pos = first[4].start()
+        page.text = text[:pos] + header + template + text[pos:]
+        # queue the edit and move on to the next file; pywikibot saves queued pages in a
+        # background thread at the write rate allowed by its put throttle, and reports
+        # the outcome of each save through the callback
+        page.save(summary="Assessment added - congratulations", asynchronous=True,
+                  callback=_report_assesment_save)
 
 #=====================================================================================
-def update_previous_page(challenge_list: list):
-    # text to be added to Photo Challenge talk page
+def _previous_page_update(challenge_list: list) -> dict:
+    ''' Edit of [[Commons:Photo challenge/Previous]] listing winners of both challenges: new 
+        winners prepended on the server, so the edit does not depend on the current text '''
     challenge1, challenge2 = challenge_list
-    year, month_str, theme = challenge1.split(" - ")   
-    month  = datetime.datetime.strptime( month_str, "%B").strftime("%m")
+    year, month_str, theme, month = split_challenge(challenge1)
     header = f'{{{{ucfirst:{{{{ISOdate|{year}-{month}|{{{{PAGELANGUAGE}}}}}}}}}}}}'
     text1  = f"{{{{Commons:Photo challenge/{challenge1}/Winners}}}}" 
     text2  = f"{{{{Commons:Photo challenge/{challenge2}/Winners}}}}" 
-    
-    site = pywikibot.Site("commons", "commons")  # Wikimedia Commons
+    return dict(summary=f"Add {month_str} winners", 
+                prependtext=f"=== {header} ===\n{text1}\n{text2}\n\n")
+
+#=====================================================================================
+def update_previous_page(challenge_list: list):
+    site = _commons_site()  # Wikimedia Commons
     page = pywikibot.Page(site, 'Commons:Photo challenge/Previous')
-    if not page.exists():
-        print('Page does not exist')
-        return
+    _preload_for_save(site, [page])
+    _save_if_exists(page, 'Page does not exist', _previous_page_update, challenge_list)
 
-    page.text = f"=== {header} ===\n{text1}\n{text2}\n\n" + page.text
-    page.save(summary=f"Add {month_str} winners")
+#=====================================================================================
+def publish_monthly_results(challenge_list: list, file_dfs=None):
+    ''' Same as announce_challenge_winners followed by update_previous_page, but both pages 
+        are loaded with a single query, for the existence and {{nobots}} opt-out checks. The 
+        two edits are still saved one after the other, so if the second one fails the first 
+        one stays in place. 
+        Optional file_dfs are DataFrames returned by process_challenge for each challenge, 
+        used instead of reading "<challenge>_files.csv" files back.
+    '''
+    site      = _commons_site()  # Wikimedia Commons
+    talk_page = pywikibot.Page(site, 'Commons:Photo challenge').toggleTalkPage()
+    prev_page = pywikibot.Page(site, 'Commons:Photo challenge/Previous')
+    _preload_for_save(site, [talk_page, prev_page])
+    _save_if_exists(talk_page, 'Talk page does not exist', _winners_announcement, challenge_list, file_dfs)
+    _save_if_exists(prev_page, 'Page does not exist', _previous_page_update, challenge_list)
 
 #=====================================================================================
 def add_line_breaks(sentence: str, max_len: int):
+    ''' Greedily pack words into lines of at most max_len characters (longer words get a 
+        line of their own) and join the lines with "<br/>" '''
     words = sentence.split()
     lines = []
-    current_line = []
-
-    current_len = 0
-    for word in words:
-        if current_len + len(word) + (1 if current_line else 0) <= max_len:
-            current_line.append(word)
-            current_len += len(word) + (1 if current_line[:-1] else 0)
+    start = 0  # index of the first word of the current line
+    length = 0 # length of the current line
+    for i, word in enumerate(words):
+        add = len(word) + (1 if i > start else 0)
+        if length + add > max_len and i > start:
+            lines.append(" ".join(words[start:i]))
+            start, length = i, len(word)
         else:
-            lines.append(" ".join(current_line))
-            current_line = [word]
-            current_len = len(word)
-    if current_line:
-        lines.append(" ".join(current_line))
+            length += add
+    if words:
+        lines.append(" ".join(words[start:]))
 
     return ' <br/>'.join(lines)
         
 #=====================================================================================
 def process_challenge(challenge: str):
+    ''' Count votes of a single challenge and create its revised voting, result and winners 
+        pages. Returns DataFrame of ranked files, which can be passed to the functions 
+        announcing the winners '''
     vote_file    = f"{challenge}_voting.txt"
     error_file   = f"{challenge}_error.txt"
     revised_file = f"{challenge}_revised.txt"
@@ -771,17 +977,21 @@ def process_challenge(challenge: str):
     error_fp     = open(error_file, "w")
 
     # Parse Commons:Photo_challenge submission page
-    site = pywikibot.Site("commons", "commons")  # Wikimedia Commons
+    site = _commons_site()  # Wikimedia Commons
     page = pywikibot.Page(site, f"Commons:Photo challenge/{challenge}/Voting")
     if not page:
         error_fp.write(f"Can't open [[Commons:Photo challenge/{challenge}/Voting]]\n")
         error_fp.close()
         return
 
-    wiki_text = page.get()
+    wiki_text = cached_page_text(page)
     file_df, vote_df= parse_voting_page(wiki_text)
 
-    voter_df = validate_voters(site, vote_df, challenge)
+    # voter validation waits mostly on API requests, so revise the voting page meanwhile
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        voters = executor.submit(validate_voters, site, vote_df, challenge)
+        revise_voting_page(wiki_text, revised_file)
+        voter_df = voters.result()
     vote_df  = validate_votes(vote_df, voter_df)
     vote_df.to_csv(votes_file, index=False)
 
@@ -790,19 +1000,20 @@ def process_challenge(challenge: str):
     
     errors = list_errors(vote_df, voter_df, challenge)
 
-    # revise voting page and create result page
-    revise_voting_page(wiki_text, revised_file)
+    # create winners and result pages
     create_winners_page(file_df, winners_file, challenge)
 
     # create result page
     n_voter = vote_df['voter'].nunique()
     create_result_page(file_df, n_voter, result_file, errors)
 
+    return file_df
+
 #=====================================================================================
 def create_commons_page(challenge: str, subpage1: str, subpage2: str):
     '''  '''
     # Connect to Wikimedia Commons
-    site = pywikibot.Site('commons', 'commons')
+    site = _commons_site()
     
     # Get source page
     source_file  = f"{challenge}_{subpage1}.txt"